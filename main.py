@@ -1,15 +1,22 @@
 import os
-import requests
+import httpx
 import boto3
-import psycopg2
+from botocore.config import Config as BotoConfig
+import asyncpg
 import asyncio
-import time
+import hashlib
+import orjson
+import secrets
+import tempfile
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import logging
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 app = FastAPI()
@@ -22,6 +29,26 @@ RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
 RAGFLOW_DATASET_ID = os.getenv("RAGFLOW_DATASET_ID")
 RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
 
+# Request headers and endpoints are built once rather than on every call
+_AUTH_HEADERS = {"Authorization": f"Bearer {RAGFLOW_API_KEY}"}
+# JSON bodies are pre-serialized with orjson and sent as raw content
+_JSON_HEADERS = {"Content-Type": "application/json"}
+DOCUMENTS_PATH = f"/api/v1/datasets/{RAGFLOW_DATASET_ID}/documents"
+PARSE_CHUNKS_PATH = f"/api/v1/datasets/{RAGFLOW_DATASET_ID}/chunks"
+DOCUMENT_CHUNKS_PATH_TMPL = f"/api/v1/datasets/{RAGFLOW_DATASET_ID}/documents/{{doc_id}}/chunks"
+CHATS_PATH = "/api/v1/chats"
+CHAT_SESSIONS_PATH_TMPL = "/api/v1/chats/{chat_id}/sessions"
+CHAT_COMPLETIONS_PATH_TMPL = "/api/v1/chats/{chat_id}/completions"
+
+# Shared HTTP/2 client so sequential RAGFlow calls reuse one keep-alive connection
+RAGFLOW = httpx.AsyncClient(
+    base_url=RAGFLOW_BASE_URL or "",
+    headers=_AUTH_HEADERS,
+    http2=True,
+    timeout=httpx.Timeout(float(os.getenv("RAGFLOW_TIMEOUT", 120)), connect=10.0),
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+)
+
 class DocumentInput(BaseModel):
     document_id: str
     source: str  # "postgres" or "minio"
@@ -33,9 +60,33 @@ PG_CONFIG = {
     'port': int(os.getenv('POSTGRES_PORT', 5432)),
     'user': os.getenv('POSTGRES_USER'),
     'password': os.getenv('POSTGRES_PASSWORD'),
-    'dbname': os.getenv('POSTGRES_DB'),
+    'database': os.getenv('POSTGRES_DB'),
 }
 
+# Connections are shared across requests to avoid a TCP/auth handshake per fetch;
+# create_pool opens min_size connections up front, so the pool starts warm
+PG_POOL_MIN = int(os.getenv('POSTGRES_POOL_MIN', 5))
+PG_POOL_MAX = int(os.getenv('POSTGRES_POOL_MAX', 25))
+# Set to 0 behind PgBouncer in transaction mode, where a server connection
+# isn't pinned to us; PgBouncer's max_prepared_statements handles the rest
+PG_STATEMENT_CACHE_SIZE = int(os.getenv('POSTGRES_STATEMENT_CACHE_SIZE', 100))
+PG_POOL = None
+
+@app.on_event("startup")
+async def open_pg_pool():
+    global PG_POOL
+    PG_POOL = await asyncpg.create_pool(
+        **PG_CONFIG,
+        min_size=PG_POOL_MIN,
+        max_size=PG_POOL_MAX,
+        statement_cache_size=PG_STATEMENT_CACHE_SIZE,
+        command_timeout=30,
+    )
+
+@app.on_event("shutdown")
+async def close_pg_pool():
+    if PG_POOL is not None:
+        await PG_POOL.close()
 
 
 # MinIO / S3 configuration
@@ -46,133 +97,430 @@ MINIO_CONFIG = {
     'bucket_name': os.getenv("MINIO_BUCKET"),
 }
 
-def fetch_document(document_id: str, source: str):
+# A single client keeps its HTTP connection pool warm across requests
+S3_CLIENT = boto3.client('s3',
+                         endpoint_url=MINIO_CONFIG['endpoint_url'],
+                         aws_access_key_id=MINIO_CONFIG['aws_access_key_id'],
+                         aws_secret_access_key=MINIO_CONFIG['aws_secret_access_key'],
+                         config=BotoConfig(max_pool_connections=50,
+                                           retries={'max_attempts': 3, 'mode': 'standard'}))
+
+# Documents larger than this are spooled to disk instead of held in memory
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_READ_CHUNK_SIZE = 64 * 1024
+
+_FETCH_CONTRACT_QUERY = (
+    'SELECT "documentName", "documentContent" FROM "ContractVersion" '
+    'WHERE "contractId" = $1 LIMIT 1'
+)
+
+class CopyRowWriter:
+    """
+    File-like target for a binary COPY of a single row.
+    The row's leading columns are kept in `fields`; its last column is
+    written straight through to `sink` so it never builds up in memory.
+
+    Field values are passed on exactly as the binary COPY format encodes
+    them. That is the raw bytes only for `text`/`varchar` (in the client
+    encoding) and `bytea` columns, which is what `documentContent` and
+    `documentName` are assumed to be; other types such as `jsonb` carry
+    extra framing (a version byte) that would end up in the output.
+    """
+
+    _HEADER_SIZE = 19  # 11-byte signature, int32 flags, int32 extension length
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.fields = []
+        self.found = False
+        self._state = "header"
+        self._need = self._HEADER_SIZE
+        self._pending = b""
+        self._fields_left = 0
+        self._remaining = 0
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view) and self._state != "done":
+            if self._state == "stream":
+                chunk = view[:self._remaining]
+                self.sink.write(chunk)
+                self._remaining -= len(chunk)
+                view = view[len(chunk):]
+                if not self._remaining:
+                    self._next_field()
+                continue
+            missing = self._need - len(self._pending)
+            self._pending += view[:missing]
+            view = view[missing:]
+            if len(self._pending) == self._need:
+                token, self._pending = self._pending, b""
+                self._consume(token)
+        return len(data)
+
+    def _expect(self, state, size):
+        self._state = state
+        self._need = size
+
+    def _next_field(self):
+        self._fields_left -= 1
+        if self._fields_left:
+            self._expect("length", 4)
+        else:
+            # Only the first row is of interest
+            self._state = "done"
+
+    def _consume(self, token):
+        if self._state == "header":
+            extension_size = int.from_bytes(token[15:19], "big")
+            if extension_size:
+                self._expect("extension", extension_size)
+            else:
+                self._expect("tuple", 2)
+        elif self._state == "extension":
+            self._expect("tuple", 2)
+        elif self._state == "tuple":
+            field_count = int.from_bytes(token, "big", signed=True)
+            if field_count <= 0:
+                self._state = "done"
+                return
+            self.found = True
+            self._fields_left = field_count
+            self._expect("length", 4)
+        elif self._state == "length":
+            length = int.from_bytes(token, "big", signed=True)
+            last = self._fields_left == 1
+            if length <= 0:
+                if not last:
+                    self.fields.append(None if length < 0 else b"")
+                self._next_field()
+            elif last:
+                self._state = "stream"
+                self._remaining = length
+            else:
+                self._expect("value", length)
+        elif self._state == "value":
+            self.fields.append(token)
+            self._next_field()
+
+async def fetch_document(document_id: str, source: str):
+    """
+    Fetch a document from PostgreSQL or MinIO.
+    Returns (content, name, size in bytes or None if not known up front).
+    """
     if source == "postgres":
+        # Stream the content into a spooled temp file rather than fetching it
+        # as one Python object; large documents overflow to disk
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        writer = CopyRowWriter(spool)
         try:
-            conn = psycopg2.connect(**PG_CONFIG)
-            cursor = conn.cursor()
-            cursor.execute('SELECT "documentContent", "documentName" FROM "ContractVersion" WHERE "contractId" = %s', (document_id,))
-            result = cursor.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail="Document not found in PostgreSQL")
-            document_content, document_name = result
-            return document_content, document_name
-        finally:
-            cursor.close()
-            conn.close()
+            async with PG_POOL.acquire() as conn:
+                # asyncpg hands file-like outputs to a worker thread for writing
+                await conn.copy_from_query(_FETCH_CONTRACT_QUERY, document_id, output=writer, format='binary')
+        except Exception:
+            spool.close()
+            raise
+        if not writer.found:
+            spool.close()
+            raise HTTPException(status_code=404, detail="Document not found in PostgreSQL")
+        spool.seek(0)
+        document_name = writer.fields[0]
+        return spool, document_name.decode('utf-8') if document_name is not None else None, None
     elif source == "minio":
-        s3 = boto3.client('s3',
-                          endpoint_url=MINIO_CONFIG['endpoint_url'],
-                          aws_access_key_id=MINIO_CONFIG['aws_access_key_id'],
-                          aws_secret_access_key=MINIO_CONFIG['aws_secret_access_key'])
         try:
-            response = s3.get_object(Bucket=MINIO_CONFIG['bucket_name'], Key=document_id)
-            return response['Body'].read().decode('utf-8')
+            response = await asyncio.to_thread(
+                S3_CLIENT.get_object, Bucket=MINIO_CONFIG['bucket_name'], Key=document_id
+            )
+            # Hand back the StreamingBody itself so the upload reads it in chunks;
+            # its size comes from the object metadata since it can't be seeked
+            return response['Body'], document_id, response.get('ContentLength')
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Could not fetch document from MinIO: {e}")
     else:
         raise HTTPException(status_code=400, detail="Invalid source specified (must be 'postgres' or 'minio')")
 
-def upload_to_ragflow(document_text: str, document_name: str):
-    files = {'file': (document_name, document_text)}
-    endpoint = f"{RAGFLOW_BASE_URL}/api/v1/datasets/{RAGFLOW_DATASET_ID}/documents"
-    headers = {
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}"
-    }
-    resp = requests.post(endpoint, files=files, headers=headers)
-    if not resp.ok:
+# sha256 of document content -> RAGFlow document ID, so resubmitting the same
+# content skips the upload and chunking pipeline
+UPLOAD_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+def is_seekable(document):
+    """
+    Whether a file-like object supports seeking. SpooledTemporaryFile only
+    gained seekable() in Python 3.11, so probe seek/tell directly.
+    """
+    try:
+        document.seek(document.tell())
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
+def hash_document(document):
+    """
+    Compute the sha256 of a document's content.
+    Returns the content in a form that can still be uploaded (non-seekable
+    streams are copied into a rewound spooled temp file) and the hex digest.
+    """
+    digest = hashlib.sha256()
+    if isinstance(document, str):
+        document = document.encode('utf-8')
+    if isinstance(document, (bytes, bytearray, memoryview)):
+        document = bytes(document)
+        digest.update(document)
+        return document, digest.hexdigest()
+    if is_seekable(document):
+        for chunk in iter(lambda: document.read(_READ_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        document.seek(0)
+        return document, digest.hexdigest()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for chunk in iter(lambda: document.read(_READ_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        spool.write(chunk)
+    document.close()
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+def _multipart_upload(document, document_name: str, length=None):
+    """
+    Build a streaming multipart/form-data body with `document` as its
+    `file` field. File-like content is read in chunks in a worker thread,
+    so neither the whole form nor the whole document is held in memory
+    and the event loop never blocks on disk or socket reads.
+    `length` is the document size, if known, for non-seekable streams.
+    Returns (headers, body iterator).
+    """
+    boundary = secrets.token_hex(16)
+    filename = (document_name or "").translate({0x22: "%22", 0x0D: "%0D", 0x0A: "%0A"})
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    if isinstance(document, str):
+        document = document.encode('utf-8')
+
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    if isinstance(document, bytes):
+        length = len(document)
+    elif is_seekable(document):
+        position = document.tell()
+        length = document.seek(0, os.SEEK_END) - position
+        document.seek(position)
+    if length is not None:
+        headers["Content-Length"] = str(len(head) + length + len(tail))
+
+    async def body():
+        yield head
+        if isinstance(document, bytes):
+            yield document
+        else:
+            while chunk := await asyncio.to_thread(document.read, _READ_CHUNK_SIZE):
+                yield chunk
+        yield tail
+
+    return headers, body()
+
+async def upload_to_ragflow(document, document_name: str, length=None):
+    """
+    Upload a document to the RAGFlow dataset.
+    `document` may be str/bytes content or a readable file-like object;
+    pass `length` for streams that can't be seeked to find their size.
+    """
+    headers, body = _multipart_upload(document, document_name, length)
+    resp = await RAGFLOW.post(DOCUMENTS_PATH, content=body, headers=headers)
+    if not resp.is_success:
         raise HTTPException(status_code=502, detail=f"Upload failed: {resp.text}")
-    return resp.json()
-
-def trigger_chunk_and_ingest(doc_id: str):
-    # Use the correct RAGFlow parse documents endpoint
-    chunk_endpoint = f"{RAGFLOW_BASE_URL}/api/v1/datasets/{RAGFLOW_DATASET_ID}/chunks"
-    headers = {
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {"document_ids": [doc_id]}
-    chunk_resp = requests.post(chunk_endpoint, json=payload, headers=headers)
-    if not chunk_resp.ok:
-        raise HTTPException(status_code=502, detail=f"Chunking failed: {chunk_resp.text}")
+    return orjson.loads(resp.content)
+
+# Chunk triggers from concurrent requests are coalesced into one POST, flushed
+# when the batch is full or the oldest pending ID has waited flush_interval.
+CHUNK_BATCH_SIZE = int(os.getenv("CHUNK_BATCH_SIZE", 16))
+CHUNK_FLUSH_INTERVAL = int(os.getenv("CHUNK_FLUSH_INTERVAL_MS", 50)) / 1000
+_CHUNK_QUEUE = asyncio.Queue()
+_chunk_batcher_task = None
+# In-flight flushes; referenced so they aren't garbage collected mid-POST
+_chunk_flush_tasks = set()
+
+async def _flush_chunk_batch(batch):
+    payload = {"document_ids": [doc_id for doc_id, _ in batch]}
+    try:
+        # Use the correct RAGFlow parse documents endpoint
+        chunk_resp = await RAGFLOW.post(PARSE_CHUNKS_PATH, content=orjson.dumps(payload), headers=_JSON_HEADERS)
+        if not chunk_resp.is_success:
+            raise HTTPException(status_code=502, detail=f"Chunking failed: {chunk_resp.text}")
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+    else:
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+    finally:
+        # Don't leave callers waiting if the flush itself was cancelled
+        for _, future in batch:
+            if not future.done():
+                future.cancel()
+
+async def _chunk_batcher():
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch = [await _CHUNK_QUEUE.get()]
+            deadline = loop.time() + CHUNK_FLUSH_INTERVAL
+            while len(batch) < CHUNK_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_CHUNK_QUEUE.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Flush in the background so the next batch can be collected while
+            # this POST is in flight
+            task = asyncio.create_task(_flush_chunk_batch(batch))
+            _chunk_flush_tasks.add(task)
+            task.add_done_callback(_chunk_flush_tasks.discard)
+            batch = []
+    finally:
+        # Don't leave callers of a partly collected batch waiting forever
+        for _, future in batch:
+            if not future.done():
+                future.cancel()
+
+@app.on_event("startup")
+async def start_chunk_batcher():
+    global _chunk_batcher_task
+    _chunk_batcher_task = asyncio.create_task(_chunk_batcher())
+
+@app.on_event("shutdown")
+async def stop_chunk_batcher():
+    if _chunk_batcher_task is not None:
+        _chunk_batcher_task.cancel()
+        await asyncio.gather(_chunk_batcher_task, return_exceptions=True)
+    # Triggers that were queued but never collected won't be sent
+    while not _CHUNK_QUEUE.empty():
+        _, future = _CHUNK_QUEUE.get_nowait()
+        if not future.done():
+            future.cancel()
+    # Let in-flight POSTs finish while the RAGFlow client is still open
+    await asyncio.gather(*_chunk_flush_tasks, return_exceptions=True)
+
+# Registered after stop_chunk_batcher: shutdown hooks run in registration
+# order, and pending chunk flushes still need the client
+@app.on_event("shutdown")
+async def close_ragflow_client():
+    await RAGFLOW.aclose()
+
+async def trigger_chunk_and_ingest(doc_id: str):
+    """
+    Queue a document for parsing and wait until its batch has been submitted.
+    Falls back to a direct request if the batcher isn't running.
+    """
+    future = asyncio.get_running_loop().create_future()
+    if _chunk_batcher_task is None or _chunk_batcher_task.done():
+        logger.warning("Chunk batcher not running, triggering document %s directly", doc_id)
+        await _flush_chunk_batch([(doc_id, future)])
+    else:
+        await _CHUNK_QUEUE.put((doc_id, future))
+    await future
 
-def check_document_progress(document_id: str):
+async def check_document_progress(document_id: str):
     """
     Check the parsing progress of a document using the chunks API.
     Returns the document progress information.
     """
-    endpoint = f"{RAGFLOW_BASE_URL}/api/v1/datasets/{RAGFLOW_DATASET_ID}/documents/{document_id}/chunks"
-    headers = {
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}"
-    }
+    endpoint = DOCUMENT_CHUNKS_PATH_TMPL.format(doc_id=document_id)
     params = {
         "page": 1,
         "page_size": 1  # We only need the doc info, not the actual chunks
     }
     
-    resp = requests.get(endpoint, headers=headers, params=params)
-    if not resp.ok:
+    resp = await RAGFLOW.get(endpoint, params=params)
+    if not resp.is_success:
         raise HTTPException(status_code=502, detail=f"Progress check failed: {resp.text}")
     
-    data = resp.json()
+    data = orjson.loads(resp.content)
     if data.get("code") != 0:
         raise HTTPException(status_code=502, detail=f"API error: {data}")
     
     return data["data"]["doc"]
 
-async def monitor_document_progress(document_id: str, max_wait_time: int = 300, poll_interval: int = 5):
+async def _wait_for_parse(document_id: str, poll_interval: float, initial_poll_interval: float):
     """
-    Monitor document parsing progress by polling the API regularly.
-    
-    Args:
-        document_id: The Ragflow document ID to monitor
-        max_wait_time: Maximum time to wait in seconds (default: 5 minutes)
-        poll_interval: How often to check progress in seconds (default: 5 seconds)
-    
-    Returns:
-        dict: Final document status with progress information
+    Poll a document's parsing progress with exponential backoff until it
+    completes or fails. Returns (status, doc_info).
     """
-    start_time = time.time()
+    delay = initial_poll_interval
     
-    while time.time() - start_time < max_wait_time:
+    while True:
         try:
-            doc_info = check_document_progress(document_id)
+            doc_info = await check_document_progress(document_id)
             progress = doc_info.get("progress", 0)
             status = doc_info.get("status", "unknown")
             progress_msg = doc_info.get("progress_msg", "")
             
-            logging.info(f"Document {document_id} - Progress: {progress}%, Status: {status}, Message: {progress_msg}")
+            logger.info("Document %s - Progress: %s%%, Status: %s, Message: %s", document_id, progress, status, progress_msg)
             
             # Check if parsing is complete
             # Status "1" typically means completed, progress 1.0 means 100%
             if status == "1" and progress >= 1.0:
-                logging.info(f"Document {document_id} parsing completed successfully!")
-                return {
-                    "status": "completed",
-                    "document_info": doc_info,
-                    "total_wait_time": time.time() - start_time
-                }
+                logger.info("Document %s parsing completed successfully!", document_id)
+                return "completed", doc_info
             
             # Check for error states
             if status in ["-1", "2"]:  # Common error status codes
-                logging.error(f"Document {document_id} parsing failed with status {status}")
-                return {
-                    "status": "failed",
-                    "document_info": doc_info,
-                    "total_wait_time": time.time() - start_time
-                }
-            
-            # Wait before next poll
-            await asyncio.sleep(poll_interval)
+                logger.error("Document %s parsing failed with status %s", document_id, status)
+                return "failed", doc_info
             
         except Exception as e:
-            logging.error(f"Error checking progress for document {document_id}: {e}")
-            await asyncio.sleep(poll_interval)
+            logger.error("Error checking progress for document %s: %s", document_id, e)
+        
+        # Wait before next poll, backing off so fast parses are seen quickly
+        # and long ones aren't polled more than once per poll_interval
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.7, poll_interval)
+
+async def monitor_document_progress(
+    document_id: str,
+    max_wait_time: int = 300,
+    poll_interval: float = 5,
+    initial_poll_interval: float = 0.25
+):
+    """
+    Monitor document parsing progress by polling the API with exponential backoff.
+    
+    Args:
+        document_id: The Ragflow document ID to monitor
+        max_wait_time: Maximum time to wait in seconds (default: 5 minutes)
+        poll_interval: Upper bound on the delay between checks in seconds (default: 5 seconds)
+        initial_poll_interval: Delay before the second check in seconds (default: 0.25 seconds)
+    
+    Returns:
+        dict: Final document status with progress information
+    """
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    
+    try:
+        status, doc_info = await asyncio.wait_for(
+            _wait_for_parse(document_id, poll_interval, initial_poll_interval),
+            timeout=max_wait_time
+        )
+        return {
+            "status": status,
+            "document_info": doc_info,
+            "total_wait_time": loop.time() - start_time
+        }
+    except asyncio.TimeoutError:
+        pass
     
     # Timeout reached
-    logging.warning(f"Timeout reached while monitoring document {document_id}")
+    logger.warning("Timeout reached while monitoring document %s", document_id)
     try:
-        final_doc_info = check_document_progress(document_id)
+        final_doc_info = await check_document_progress(document_id)
         return {
             "status": "timeout",
             "document_info": final_doc_info,
@@ -186,7 +534,7 @@ async def monitor_document_progress(document_id: str, max_wait_time: int = 300,
         }
 
 @app.post("/process/")
-def process_document(input: DocumentInput):
+async def process_document(input: DocumentInput):
     """
     API endpoint to:
     - Fetch document by ID and source
@@ -195,20 +543,35 @@ def process_document(input: DocumentInput):
     """
 
 
-    doc_content, doc_name = fetch_document(input.document_id, input.source)
-    logging.info(f"Fetched document: {doc_name} for contractId: {input.document_id}")
-    upload_result = upload_to_ragflow(doc_content, doc_name)
-    logging.info(f"Upload response: {upload_result}")
+    doc_content, doc_name, doc_length = await fetch_document(input.document_id, input.source)
+    logger.info("Fetched document: %s for contractId: %s", doc_name, input.document_id)
+    doc_content, content_hash = await asyncio.to_thread(hash_document, doc_content)
+    try:
+        cached_doc_id = UPLOAD_CACHE.get(content_hash)
+        if cached_doc_id:
+            logger.info("Content already ingested as %s, skipping upload", cached_doc_id)
+            return {"status": "cached", "document_id": cached_doc_id}
+
+        upload_result = await upload_to_ragflow(doc_content, doc_name, doc_length)
+        logger.info("Upload response: %s", upload_result)
+    finally:
+        if hasattr(doc_content, "close"):
+            doc_content.close()
 
     # Try to get the document ID from the upload response
     # Extract document ID from upload response (first item in data array)
     ragflow_doc_id = upload_result["data"][0]["id"]
-    logging.info(f"Document ID used for parsing: {ragflow_doc_id}")
+    logger.info("Document ID used for parsing: %s", ragflow_doc_id)
 
 
-    trigger_chunk_and_ingest(ragflow_doc_id)
+    await trigger_chunk_and_ingest(ragflow_doc_id)
+    UPLOAD_CACHE[content_hash] = ragflow_doc_id
     return {"status": "success", "document_id": ragflow_doc_id}
 
+# Sorted dataset IDs -> create-assistant response, so documents in the same
+# dataset(s) share one summary assistant instead of creating one each
+_ASSISTANT_CACHE = {}
+
 @app.post("/process_with_monitoring/")
 async def process_document_with_monitoring(input: DocumentInput):
     """
@@ -221,22 +584,26 @@ async def process_document_with_monitoring(input: DocumentInput):
     """
     try:
         # Fetch document
-        doc_content, doc_name = fetch_document(input.document_id, input.source)
-        logging.info(f"Fetched document: {doc_name} for contractId: {input.document_id}")
+        doc_content, doc_name, doc_length = await fetch_document(input.document_id, input.source)
+        logger.info("Fetched document: %s for contractId: %s", doc_name, input.document_id)
         
         # Upload to RAGFlow
-        upload_result = upload_to_ragflow(doc_content, doc_name)
-        logging.info(f"Upload response: {upload_result}")
+        try:
+            upload_result = await upload_to_ragflow(doc_content, doc_name, doc_length)
+        finally:
+            if hasattr(doc_content, "close"):
+                doc_content.close()
+        logger.info("Upload response: %s", upload_result)
 
         # Extract document ID from upload response
         ragflow_doc_id = upload_result["data"][0]["id"]
-        logging.info(f"Document ID used for parsing: {ragflow_doc_id}")
+        logger.info("Document ID used for parsing: %s", ragflow_doc_id)
 
         # Trigger chunking & ingestion
-        trigger_chunk_and_ingest(ragflow_doc_id)
+        await trigger_chunk_and_ingest(ragflow_doc_id)
         
         # Monitor progress
-        logging.info(f"Starting progress monitoring for document {ragflow_doc_id}")
+        logger.info("Starting progress monitoring for document %s", ragflow_doc_id)
         progress_result = await monitor_document_progress(ragflow_doc_id)
         
         # Create chat assistant automatically after successful parsing
@@ -245,64 +612,82 @@ async def process_document_with_monitoring(input: DocumentInput):
         summary_result = None
         
         if progress_result.get("status") == "completed":
-            logging.info(f"Document parsing completed, creating chat assistant for document {input.document_id}")
+            logger.info("Document parsing completed, creating chat assistant for document %s", input.document_id)
             
-            # Create chat assistant with simplified approach (no complex prompt)
-            assistant_name = f"Summary Assistant - {doc_name}"
-            chat_assistant_result = create_chat_assistant(
-                name=assistant_name,
-                dataset_ids=[RAGFLOW_DATASET_ID],
-                avatar=""
-            )
-            logging.info(f"Chat assistant created: {chat_assistant_result}")
+            # Reuse the summary assistant for this dataset if one was already
+            # created; otherwise create one with simplified approach (no complex prompt)
+            dataset_ids = [RAGFLOW_DATASET_ID]
+            assistant_key = tuple(sorted(dataset_ids))
+            chat_assistant_result = _ASSISTANT_CACHE.get(assistant_key)
+            if chat_assistant_result:
+                logger.info("Reusing chat assistant %s", chat_assistant_result["data"]["id"])
+            else:
+                assistant_name = f"Summary Assistant - {', '.join(assistant_key)}"
+                chat_assistant_result = await create_chat_assistant(
+                    name=assistant_name,
+                    dataset_ids=dataset_ids,
+                    avatar=""
+                )
+                logger.info("Chat assistant created: %s", chat_assistant_result)
+                if not (chat_assistant_result and chat_assistant_result.get("code") == 0):
+                    # Assistant names are unique, so after a restart the
+                    # dataset's assistant may already exist in RAGFlow
+                    existing = await find_chat_assistant(assistant_name)
+                    if existing:
+                        logger.info("Using existing chat assistant %s", existing["id"])
+                        chat_assistant_result = {"code": 0, "data": existing}
+                if chat_assistant_result and chat_assistant_result.get("code") == 0:
+                    _ASSISTANT_CACHE[assistant_key] = chat_assistant_result
             
             # If assistant was created successfully, create a session and get summary
             if chat_assistant_result and chat_assistant_result.get("code") == 0:
                 chat_id = chat_assistant_result["data"]["id"]
-                logging.info(f"Creating session for chat assistant {chat_id}")
+                logger.info("Creating session for chat assistant %s", chat_id)
                 
                 # Create session
-                session_result = create_chat_session(
+                session_result = await create_chat_session(
                     chat_id=chat_id,
                     session_name=f"Summary Session - {doc_name}"
                 )
-                logging.info(f"Session created: {session_result}")
+                logger.info("Session created: %s", session_result)
                 
                 # If session was created successfully, get document summary
                 if session_result and session_result.get("code") == 0:
                     session_id = session_result["data"]["id"]
-                    logging.info(f"Getting document summary for session {session_id}")
+                    logger.info("Getting document summary for session %s", session_id)
                     
                     # Get summary
-                    summary_result = get_document_summary(
+                    summary_result = await get_document_summary(
                         chat_id=chat_id,
                         session_id=session_id,
                         document_name=doc_name
                     )
-                    logging.info(f"Summary generated: {summary_result}")
+                    logger.info("Summary generated: %s", summary_result)
                 else:
-                    logging.error(f"Failed to create session: {session_result}")
+                    logger.error("Failed to create session: %s", session_result)
+                    # The cached assistant may have been deleted in RAGFlow
+                    _ASSISTANT_CACHE.pop(assistant_key, None)
             else:
-                logging.error(f"Failed to create chat assistant: {chat_assistant_result}")
+                logger.error("Failed to create chat assistant: %s", chat_assistant_result)
                 # Try to continue anyway - maybe assistant was partially created
                 if chat_assistant_result and "data" in chat_assistant_result and "id" in chat_assistant_result["data"]:
                     chat_id = chat_assistant_result["data"]["id"]
-                    logging.info(f"Attempting to create session with partially created assistant {chat_id}")
+                    logger.info("Attempting to create session with partially created assistant %s", chat_id)
                     
-                    session_result = create_chat_session(
+                    session_result = await create_chat_session(
                         chat_id=chat_id,
                         session_name=f"Summary Session - {doc_name}"
                     )
-                    logging.info(f"Session created: {session_result}")
+                    logger.info("Session created: %s", session_result)
                     
                     if session_result and session_result.get("code") == 0:
                         session_id = session_result["data"]["id"]
-                        summary_result = get_document_summary(
+                        summary_result = await get_document_summary(
                             chat_id=chat_id,
                             session_id=session_id,
                             document_name=doc_name
                         )
-                        logging.info(f"Summary generated: {summary_result}")
+                        logger.info("Summary generated: %s", summary_result)
         
         return {
             "status": "success",
@@ -316,7 +701,7 @@ async def process_document_with_monitoring(input: DocumentInput):
         }
         
     except Exception as e:
-        logging.error(f"Error processing document {input.document_id}: {e}")
+        logger.error("Error processing document %s: %s", input.document_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/check_progress/{document_id}")
@@ -325,7 +710,7 @@ async def check_progress(document_id: str):
     API endpoint to check the current parsing progress of a document.
     """
     try:
-        doc_info = check_document_progress(document_id)
+        doc_info = await check_document_progress(document_id)
         return {
             "status": "success",
             "document_id": document_id,
@@ -335,7 +720,7 @@ async def check_progress(document_id: str):
             "document_info": doc_info
         }
     except Exception as e:
-        logging.error(f"Error checking progress for document {document_id}: {e}")
+        logger.error("Error checking progress for document %s: %s", document_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -348,7 +733,7 @@ async def api_create_chat_assistant(request: Request):
     avatar = body.get("avatar", "")
     llm = body.get("llm")
     prompt = body.get("prompt")
-    result = create_chat_assistant(
+    result = await create_chat_assistant(
         name=name,
         dataset_ids=dataset_ids,
         avatar=avatar,
@@ -361,20 +746,38 @@ async def api_create_chat_assistant(request: Request):
 async def create_session_and_get_summary(chat_id: str, request: Request):
     """
     Create a session for an existing chat assistant and get document summary.
+    With `"stream": true` in the body the summary is returned as a
+    text/event-stream of RAGFlow's completion events instead of JSON.
     """
     try:
         body = await request.json()
         session_name = body.get("session_name", "Document Summary Session")
         document_name = body.get("document_name", "uploaded document")
+        stream = body.get("stream", False)
         
         # Create session
-        session_result = create_chat_session(chat_id=chat_id, session_name=session_name)
+        session_result = await create_chat_session(chat_id=chat_id, session_name=session_name)
         
         if session_result and session_result.get("code") == 0:
             session_id = session_result["data"]["id"]
             
+            # Relay the summary tokens as RAGFlow generates them
+            if stream:
+                summary_stream = await open_document_summary_stream(
+                    chat_id=chat_id,
+                    session_id=session_id,
+                    document_name=document_name
+                )
+                # relay_sse closes the upstream stream once iterated; the
+                # background task also covers a client that leaves before that
+                return StreamingResponse(
+                    relay_sse(summary_stream),
+                    media_type="text/event-stream",
+                    background=BackgroundTask(summary_stream.aclose)
+                )
+            
             # Get summary
-            summary_result = get_document_summary(
+            summary_result = await get_document_summary(
                 chat_id=chat_id,
                 session_id=session_id,
                 document_name=document_name
@@ -390,11 +793,11 @@ async def create_session_and_get_summary(chat_id: str, request: Request):
             raise HTTPException(status_code=502, detail=f"Failed to create session: {session_result}")
             
     except Exception as e:
-        logging.error(f"Error creating session and summary for chat {chat_id}: {e}")
+        logger.error("Error creating session and summary for chat %s: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def create_chat_assistant(
+async def create_chat_assistant(
     name,
     dataset_ids,
     avatar="",
@@ -412,13 +815,6 @@ def create_chat_assistant(
     Returns:
         dict: Response from RAGFlow API.
     """
-    RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
-    RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
-    url = f"{RAGFLOW_BASE_URL}/api/v1/chats"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}"
-    }
     
     # Use simple payload structure as shown in your curl example
     payload = {
@@ -434,14 +830,32 @@ def create_chat_assistant(
     if prompt:
         payload["prompt"] = prompt
         
-    response = requests.post(url, headers=headers, json=payload)
+    response = await RAGFLOW.post(CHATS_PATH, content=orjson.dumps(payload), headers=_JSON_HEADERS)
     try:
-        return response.json()
+        return orjson.loads(response.content)
     except Exception as e:
-        logging.error(f"Error creating chat assistant: {e}")
+        logger.error("Error creating chat assistant: %s", e)
         return {"error": response.text}
 
-def create_chat_session(chat_id: str, session_name: str = "Document Summary Session"):
+async def find_chat_assistant(name: str):
+    """
+    Look up a chat assistant in RAGFlow by its exact name.
+    Args:
+        name (str): Name of the chat assistant.
+    Returns:
+        dict: The assistant's details, or None if there is no such assistant.
+    """
+    response = await RAGFLOW.get(CHATS_PATH, params={"name": name})
+    try:
+        data = orjson.loads(response.content)
+    except Exception as e:
+        logger.error("Error looking up chat assistant %s: %s", name, e)
+        return None
+    if data.get("code") != 0 or not data.get("data"):
+        return None
+    return data["data"][0]
+
+async def create_chat_session(chat_id: str, session_name: str = "Document Summary Session"):
     """
     Create a chat session with the assistant.
     Args:
@@ -450,23 +864,20 @@ def create_chat_session(chat_id: str, session_name: str = "Document Summary Sess
     Returns:
         dict: Response from RAGFlow API.
     """
-    RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
-    RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
-    url = f"{RAGFLOW_BASE_URL}/api/v1/chats/{chat_id}/sessions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}"
-    }
     payload = {
         "name": session_name
     }
-    response = requests.post(url, headers=headers, json=payload)
+    response = await RAGFLOW.post(CHAT_SESSIONS_PATH_TMPL.format(chat_id=chat_id), content=orjson.dumps(payload), headers=_JSON_HEADERS)
     try:
-        return response.json()
+        return orjson.loads(response.content)
     except Exception:
         return {"error": response.text}
 
-def get_document_summary(chat_id: str, session_id: str, document_name: str):
+def _summary_question(document_name: str):
+    # Request a comprehensive summary
+    return f"Please provide a comprehensive summary of the document '{document_name}'. Include the main topics, key points, important details, and any significant findings or conclusions. Structure the summary in a clear and organized manner."
+
+async def get_document_summary(chat_id: str, session_id: str, document_name: str):
     """
     Send a message to get document summary from the chat assistant using completions API.
     Args:
@@ -476,27 +887,51 @@ def get_document_summary(chat_id: str, session_id: str, document_name: str):
     Returns:
         dict: Response from RAGFlow API.
     """
-    RAGFLOW_BASE_URL = os.getenv("RAGFLOW_BASE_URL")
-    RAGFLOW_API_KEY = os.getenv("RAGFLOW_API_KEY")
-    url = f"{RAGFLOW_BASE_URL}/api/v1/chats/{chat_id}/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {RAGFLOW_API_KEY}"
-    }
-    
-    # Request a comprehensive summary
-    summary_request = f"Please provide a comprehensive summary of the document '{document_name}'. Include the main topics, key points, important details, and any significant findings or conclusions. Structure the summary in a clear and organized manner."
-    
     payload = {
-        "question": summary_request,
+        "question": _summary_question(document_name),
         "stream": False,  # Set to False to get complete response at once
         "session_id": session_id
     }
     
-    response = requests.post(url, headers=headers, json=payload)
+    response = await RAGFLOW.post(CHAT_COMPLETIONS_PATH_TMPL.format(chat_id=chat_id), content=orjson.dumps(payload), headers=_JSON_HEADERS)
     try:
-        return response.json()
+        return orjson.loads(response.content)
     except Exception as e:
-        logging.error(f"Error getting document summary: {e}")
+        logger.error("Error getting document summary: %s", e)
         return {"error": response.text}
 
+
+async def open_document_summary_stream(chat_id: str, session_id: str, document_name: str):
+    """
+    Start a streamed document summary from the chat assistant's completions API.
+    Args:
+        chat_id (str): The chat assistant ID.
+        session_id (str): The session ID.
+        document_name (str): Name of the document for context.
+    Returns:
+        httpx.Response: Open streaming response whose body is RAGFlow's SSE feed.
+            The caller is responsible for closing it.
+    """
+    payload = {
+        "question": _summary_question(document_name),
+        "stream": True,
+        "session_id": session_id
+    }
+    request = RAGFLOW.build_request("POST", CHAT_COMPLETIONS_PATH_TMPL.format(chat_id=chat_id), content=orjson.dumps(payload), headers=_JSON_HEADERS)
+    response = await RAGFLOW.send(request, stream=True)
+    if not response.is_success:
+        await response.aread()
+        await response.aclose()
+        raise HTTPException(status_code=502, detail=f"Summary stream failed: {response.text}")
+    return response
+
+async def relay_sse(response: httpx.Response):
+    """
+    Forward the `data:` events of an upstream SSE response as they arrive.
+    """
+    try:
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                yield f"{line}\n\n"
+    finally:
+        await response.aclose()
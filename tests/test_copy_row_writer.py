@@ -0,0 +1,86 @@
+import io
+import random
+import struct
+import unittest
+
+from main import CopyRowWriter
+
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def copy_stream(rows, extension=b""):
+    """Build a binary COPY stream for `rows` (lists of bytes or None)."""
+    data = SIGNATURE + struct.pack(">ii", 0, len(extension)) + extension
+    for row in rows:
+        data += struct.pack(">h", len(row))
+        for value in row:
+            if value is None:
+                data += struct.pack(">i", -1)
+            else:
+                data += struct.pack(">i", len(value)) + value
+    return data + struct.pack(">h", -1)
+
+
+def feed(data, chunk_sizes):
+    sink = io.BytesIO()
+    writer = CopyRowWriter(sink)
+    position = 0
+    for size in chunk_sizes:
+        if position >= len(data):
+            break
+        writer.write(data[position:position + size])
+        position += size
+    if position < len(data):
+        writer.write(data[position:])
+    return writer, sink.getvalue()
+
+
+class CopyRowWriterTest(unittest.TestCase):
+
+    def assert_row(self, rows, extension=b""):
+        data = copy_stream(rows, extension)
+        rng = random.Random(len(data))
+        splits = [
+            [len(data)],
+            [1] * len(data),
+            [rng.randint(1, 64) for _ in range(len(data))],
+        ]
+        for chunk_sizes in splits:
+            writer, content = feed(data, chunk_sizes)
+            if rows:
+                self.assertTrue(writer.found)
+                self.assertEqual(writer.fields, rows[0][:-1])
+                self.assertEqual(content, rows[0][-1] or b"")
+            else:
+                self.assertFalse(writer.found)
+                self.assertEqual(writer.fields, [])
+                self.assertEqual(content, b"")
+
+    def test_streams_last_column(self):
+        content = bytes(random.Random(0).getrandbits(8) for _ in range(5000))
+        self.assert_row([[b"contract.pdf", content]])
+
+    def test_header_extension(self):
+        self.assert_row([[b"contract.pdf", b"body"]], extension=b"\x00\x01ext")
+
+    def test_null_and_empty_content(self):
+        self.assert_row([[b"contract.pdf", None]])
+        self.assert_row([[b"contract.pdf", b""]])
+
+    def test_null_and_empty_leading_column(self):
+        self.assert_row([[None, b"body"]])
+        self.assert_row([[b"", b"body"]])
+
+    def test_zero_rows(self):
+        self.assert_row([])
+
+    def test_only_first_row_is_kept(self):
+        data = copy_stream([[b"first", b"one"], [b"second", b"two"]])
+        writer, content = feed(data, [7] * len(data))
+        self.assertEqual(writer.fields, [b"first"])
+        self.assertEqual(content, b"one")
+
+
+if __name__ == "__main__":
+    unittest.main()